@@ -1,7 +1,20 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import stat
+import subprocess
+import sys
+import time
+from bisect import bisect_right
+from collections import deque
 import networkx as nx
 import matplotlib.pyplot as plt
 import tkinter as tk
 from tkinter import messagebox, simpledialog
+import region_worker
+from region_worker import WorkerConnection
 
 # Graph 
 map_graph = {
@@ -38,6 +51,32 @@ ITEM_SHELF_LIFE = {
     "Medicines": 90
 }
 
+# delay added to an edge per disruption type and difficulty level
+DISRUPTION_DELAYS = {
+    'weather': {'easy': 10, 'medium': 15, 'hard': 20},
+    'traffic': {'easy': 20, 'medium': 30, 'hard': 40}
+}
+
+# largest delay a streamed event may add: far past any shelf life, so anything bigger is a bad
+# reading (and sums of values near the float limit overflow route costs to inf)
+MAX_FEED_DELAY = 1000
+
+# delays the adversary can add to each leg: Normal, Minor, Major
+DELAY_OPTIONS = [0, 15, 30]
+
+# shelf life below which evaluate_state starts charging spoilage risk
+FRESH_SHELF_LIFE = 50
+
+# km per degree of latitude, used to project city_coords onto a flat plane
+KM_PER_DEGREE = 111.2
+
+# Show Map crops to the area around the active route once the network has more cities than this
+MAP_MAX_CITIES = 200
+MAP_VIEWPORT_MARGIN = 1.0  # degrees around the route
+
+# folder where the GUI writes its session logs
+SESSION_LOG_DIR = "sessions"
+
 
 class Vehicle:
     def __init__(self, item, quantity, shelf_life):
@@ -67,7 +106,7 @@ class GameState:
         base_time = map_graph[self.current_node][next_node]
         moves = []
 
-        for delay in [0, 15, 30]:  # Normal, Minor, Major
+        for delay in DELAY_OPTIONS:
             new_path = self.remaining_path[1:]
             new_life = self.vehicle.shelf_life - (base_time + delay)
             new_cost = self.cost + base_time + delay
@@ -89,7 +128,7 @@ def evaluate_state(state: GameState):
     if state.vehicle.shelf_life <= 0:
         return -100
     dist_penalty = len(state.remaining_path) * 10
-    spoilage_risk = max(0, 50 - state.vehicle.shelf_life)
+    spoilage_risk = max(0, FRESH_SHELF_LIFE - state.vehicle.shelf_life)
     disruption_penalty = len(state.disruptions) * 5
     return 50 - dist_penalty - spoilage_risk - disruption_penalty
 
@@ -116,6 +155,738 @@ def minimax(state: GameState, depth, is_maximizing):
                 best_state = child
         return min_eval, best_state
 
+def find_path(src, dst):
+    queue = deque([(src, [src])])
+    visited = set()
+    while queue:
+        node, path = queue.popleft()
+        if node == dst:
+            return path
+        for neighbor in map_graph.get(node, {}):
+            if neighbor not in visited:
+                visited.add(neighbor)
+                queue.append((neighbor, path + [neighbor]))
+    return []
+
+def disruption_delay(disruption_type, level):
+    kind = 'weather' if disruption_type.lower() == 'weather' else 'traffic'
+    return DISRUPTION_DELAYS[kind][level.lower()]
+
+def disruption_label(node1, node2, disruption_type, delay):
+    return f"{disruption_type.title()} delay of {delay} at edge {node1}-{node2}"
+
+def apply_edge_delay(node1, node2, delay):
+    map_graph[node1][node2] += delay
+    if node2 in map_graph and node1 in map_graph[node2]:
+        map_graph[node2][node1] += delay
+
+
+# Spatial index over city coordinates
+class SpatialIndex:
+    """KD-tree over a {name: (lat, lon)} table for nearest-node, region and distance-bound queries.
+
+    Coordinates are projected to km around the table's mean latitude. Distances are straight
+    lines on that plane, so they obey the triangle inequality and make consistent A* bounds.
+    """
+
+    def __init__(self, coords=city_coords, graph=None):
+        graph = map_graph if graph is None else graph
+        self.names = list(coords)
+        self.lat_scale = KM_PER_DEGREE
+        self.lon_scale = KM_PER_DEGREE * math.cos(math.radians(sum(lat for lat, _ in coords.values()) / len(coords)))
+        self.points = [self.project(lat, lon) for lat, lon in coords.values()]
+        self.positions = dict(zip(self.names, self.points))
+        self.tree = self.build(list(range(len(self.points))), 0)
+
+        # fastest travel per km on any edge: scaled distance never overestimates travel time
+        # (disruptions only add to weights, so this stays a lower bound)
+        rates = [weight / self.distance(node, neighbor)
+                 for node, edges in graph.items() for neighbor, weight in edges.items()
+                 if node in self.positions and neighbor in self.positions and self.distance(node, neighbor) > 0]
+        self.time_per_km = min(rates) if rates else 0
+
+    def project(self, lat, lon):
+        return (lon * self.lon_scale, lat * self.lat_scale)
+
+    def build(self, indices, depth):
+        if not indices:
+            return None
+        axis = depth % 2
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        return (indices[mid], axis, self.build(indices[:mid], depth + 1), self.build(indices[mid + 1:], depth + 1))
+
+    def nearest(self, lat, lon, k=1):
+        """The k closest names to a GPS point as [(name, km), ...], closest first."""
+        if k <= 0:
+            return []
+        target = self.project(lat, lon)
+        best = []  # max-heap on squared distance
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            point = self.points[index]
+            dist = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-dist, index))
+            elif dist < -best[0][0]:
+                heapq.heapreplace(best, (-dist, index))
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(self.tree)
+        return [(self.names[index], math.sqrt(-dist)) for dist, index in sorted(best, reverse=True)]
+
+    def within(self, min_lat, min_lon, max_lat, max_lon):
+        """Names inside a lat/lon box, e.g. the cities visible in a map viewport."""
+        low = self.project(min_lat, min_lon)
+        high = self.project(max_lat, max_lon)
+        found = []
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            point = self.points[index]
+            if low[0] <= point[0] <= high[0] and low[1] <= point[1] <= high[1]:
+                found.append(self.names[index])
+            if low[axis] <= point[axis]:
+                visit(left)
+            if point[axis] <= high[axis]:
+                visit(right)
+
+        visit(self.tree)
+        return found
+
+    def distance(self, name1, name2):
+        (x1, y1), (x2, y2) = self.positions[name1], self.positions[name2]
+        return math.hypot(x1 - x2, y1 - y2)
+
+    def time_bound(self, name1, name2):
+        if name1 not in self.positions or name2 not in self.positions:
+            return 0
+        return self.time_per_km * self.distance(name1, name2)
+
+
+# Shelf-life plans shared by every item on the same route
+def route_signature(path):
+    # minimax looks two legs ahead, so a route scores by its first two leg times and its length
+    return (tuple(map_graph[a][b] for a, b in zip(path, path[1:3])), len(path))
+
+
+class ShelfLifePlan:
+    """Threshold table of the planner's route choice between src and dst for every shelf life.
+
+    search_best_route scores each route with a two-ply minimax, so routes with the same first two
+    leg times and length always score the same. One pass over the routes keeps the first of each
+    kind (the planner's tie-break order); scoring those kinds over the shelf lives where a score
+    can still change gives the points where the choice changes. Shelf lives are whole units.
+    """
+
+    def __init__(self, src, dst, cost=0, disruptions=()):
+        self.src = src
+        self.dst = dst
+        kinds = {}
+        for path in nx.all_simple_paths(nx.DiGraph(map_graph), src, dst):
+            if len(path) >= 2:
+                kinds.setdefault(route_signature(path), path)
+
+        self.thresholds = []
+        self.routes = []
+        if not kinds:
+            return
+        # beyond this every state minimax reaches is delivered or still fresh, so no score changes
+        horizon = max(sum(legs) for legs, _ in kinds) + 2 * max(DELAY_OPTIONS) + FRESH_SHELF_LIFE + 1
+
+        for shelf_life in range(horizon + 1):
+            best_score = float('-inf')
+            best_path = None
+            for path in kinds.values():
+                candidate_state = GameState(Vehicle(None, None, shelf_life), path[0], path[1:], list(disruptions), cost, False)
+                score, _ = minimax(candidate_state, 2, True)
+                if score > best_score:
+                    best_score = score
+                    best_path = path
+            if not self.routes or best_path is not self.routes[-1]:
+                self.thresholds.append(shelf_life)
+                self.routes.append(best_path)
+
+    def route_for(self, shelf_life):
+        if not self.routes:
+            return []
+        index = bisect_right(self.thresholds, math.ceil(shelf_life)) - 1
+        return self.routes[max(index, 0)]
+
+
+def plan_catalogue(src, dst, catalogue=ITEM_SHELF_LIFE):
+    """Route every item in the catalogue from src to dst from one shared plan."""
+    plan = ShelfLifePlan(src, dst)
+    return {item: plan.route_for(shelf_life) for item, shelf_life in catalogue.items()}
+
+
+def check_plans(max_shelf_life=2 * max(ITEM_SHELF_LIFE.values())):
+    """Compare every plan lookup with a full search_best_route run; returns the (src, dst, shelf life) that differ."""
+    session = LogisticsSession()
+    mismatches = []
+    for src in map_graph:
+        for dst in map_graph:
+            if src == dst:
+                continue
+            plan = ShelfLifePlan(src, dst)
+            session.path = [src, dst]
+            for shelf_life in range(max_shelf_life + 1):
+                session.vehicle = Vehicle(None, None, shelf_life)
+                session.state = GameState(session.vehicle, src, [dst], [], 0, False)
+                if plan.route_for(shelf_life) != session.search_best_route():
+                    mismatches.append((src, dst, shelf_life))
+    return mismatches
+
+
+# Session recording
+class SessionRecorder:
+    """Append-only JSONL log of one planning session (inputs and planner decisions)."""
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    @classmethod
+    def new_session(cls, folder=SESSION_LOG_DIR):
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{time.perf_counter_ns() % 100000}.jsonl"
+        return cls(os.path.join(folder, name))
+
+    def record(self, event, **data):
+        line = json.dumps({"event": event, **data}, separators=(",", ":"))
+        self.file.write(line + "\n")
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class HistoryEntry:
+    """One applied disruption: its edge-weight delta and the planner snapshots on either side of it.
+
+    The snapshots are only reused while the truck is still where they were taken; once it has
+    moved on, undo/redo replan from its current position instead.
+    """
+
+    def __init__(self, node1, node2, delay, label, before, after):
+        self.node1 = node1
+        self.node2 = node2
+        self.delay = delay
+        self.label = label
+        self.before = before
+        self.after = after
+
+
+class LogisticsSession:
+    """Planner state for one delivery, independent of the GUI so it can be replayed headless."""
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.disrupted_edges = set()
+        self.edge_disruption_count = {}
+        self.reset()
+
+    def reset(self):
+        self.vehicle = None
+        self.state = None
+        self.path = []
+        self.route = []
+        # GameStates are never mutated once built, so snapshots share them instead of copying
+        self.undo_stack = []
+        self.redo_stack = []
+        # identifies the current edge weights: the chain of disruptions applied so far, compared
+        # exactly so two different weight sets can never share cached routes
+        self.weights_key = ()
+        self.route_cache = {}
+
+    def snapshot(self):
+        return (self.state, self.path, self.route, self.weights_key)
+
+    def restore(self, snapshot):
+        self.state, self.path, self.route, self.weights_key = snapshot
+
+    def mark_disrupted(self, node1, node2, step):
+        # Assume bi-directional for highlight
+        for edge in ((node1, node2), (node2, node1)):
+            count = self.edge_disruption_count.get(edge, 0) + step
+            if count > 0:
+                self.edge_disruption_count[edge] = count
+                self.disrupted_edges.add(edge)
+            else:
+                self.edge_disruption_count.pop(edge, None)
+                self.disrupted_edges.discard(edge)
+
+    def record(self, event, **data):
+        if self.recorder:
+            self.recorder.record(event, **data)
+
+    def start(self, src, dst, item, difficulty="Medium", shelf_life=None):
+        if shelf_life is None:
+            shelf_life = ITEM_SHELF_LIFE[item]
+        # graph is saved so a replay starts from the same weights
+        self.record("start", src=src, dst=dst, item=item, shelf_life=shelf_life,
+                    difficulty=difficulty, graph=map_graph)
+
+        started = time.perf_counter()
+        path = find_path(src, dst)
+        if not path or path[0] != src or path[-1] != dst:
+            return []
+
+        self.vehicle = Vehicle(item, quantity=None, shelf_life=shelf_life)
+        self.vehicle.position = src
+        self.path = path
+        self.route = path[1:]
+        self.state = GameState(self.vehicle, src, self.route, [], 0, False)
+        self.record("route", path=self.path, elapsed_ms=(time.perf_counter() - started) * 1000)
+        return path
+
+    def disrupt(self, node1, node2, disruption_type, level):
+        delay = disruption_delay(disruption_type, level)
+        apply_edge_delay(node1, node2, delay)
+        self.record("disruption", edge=[node1, node2], type=disruption_type, level=level, delay=delay)
+
+        before = self.snapshot()
+        label = disruption_label(node1, node2, disruption_type, delay)
+        self.reroute([(node1, node2, delay, label)])
+
+        self.undo_stack.append(HistoryEntry(node1, node2, delay, label, before, self.snapshot()))
+        self.redo_stack.clear()
+        return label
+
+    def reroute(self, disruptions):
+        """Take in disruptions already applied to map_graph and replan once for all of them."""
+        for node1, node2, delay, _ in disruptions:
+            self.weights_key = (self.weights_key, node1, node2, delay)
+            self.mark_disrupted(node1, node2, 1)
+
+        state = self.state
+        self.state = GameState(state.vehicle, state.current_node, state.remaining_path,
+                               state.disruptions + [label for *_, label in disruptions], state.cost, state.delivered)
+
+        started = time.perf_counter()
+        self.recalculate_best_route()
+        self.record("route", path=[self.state.current_node] + self.state.remaining_path,
+                    elapsed_ms=(time.perf_counter() - started) * 1000)
+
+    def undo(self):
+        """Take back the last disruption: restore its edge weights and replan from where the truck is now."""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        started = time.perf_counter()
+        apply_edge_delay(entry.node1, entry.node2, -entry.delay)
+        self.mark_disrupted(entry.node1, entry.node2, -1)
+
+        if self.state is entry.after[0]:
+            # truck hasn't moved since the disruption: the route planned before it still holds
+            self.restore(entry.before)
+        else:
+            entry.after = self.snapshot()
+            self.weights_key = entry.before[3]
+            disruptions = self.state.disruptions[:]
+            disruptions.remove(entry.label)
+            self.replan(disruptions)
+            entry.before = self.snapshot()
+
+        self.redo_stack.append(entry)
+        self.record("undo", edge=[entry.node1, entry.node2], delay=entry.delay)
+        self.record("route", path=[self.state.current_node] + self.state.remaining_path,
+                    elapsed_ms=(time.perf_counter() - started) * 1000)
+        return entry.label
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        started = time.perf_counter()
+        apply_edge_delay(entry.node1, entry.node2, entry.delay)
+        self.mark_disrupted(entry.node1, entry.node2, 1)
+
+        # moves and new disruptions clear the redo stack, so undo always left us on entry.before
+        self.restore(entry.after)
+
+        self.undo_stack.append(entry)
+        self.record("redo", edge=[entry.node1, entry.node2], delay=entry.delay)
+        self.record("route", path=[self.state.current_node] + self.state.remaining_path,
+                    elapsed_ms=(time.perf_counter() - started) * 1000)
+        return entry.label
+
+    def replan(self, disruptions):
+        # keep the truck's position, elapsed time and shelf life; only the route ahead changes
+        state = self.state
+        self.state = GameState(state.vehicle, state.current_node, state.remaining_path,
+                               disruptions, state.cost, state.delivered)
+        if not self.state.is_terminal():
+            self.recalculate_best_route()
+
+    def next_move(self):
+        started = time.perf_counter()
+        _, new_state = minimax(self.state, 2, True)
+        self.state = new_state
+        # the moves redo would restore belong to a timeline we just left
+        self.redo_stack.clear()
+        self.record("move", node=new_state.current_node, cost=new_state.cost,
+                    shelf_life=new_state.vehicle.shelf_life,
+                    elapsed_ms=(time.perf_counter() - started) * 1000)
+        return new_state
+
+    def recalculate_best_route(self):
+        key = (self.weights_key, self.state.current_node, self.path[-1], self.state.vehicle.shelf_life,
+               self.state.cost, len(self.state.disruptions))
+        if key in self.route_cache:
+            best_path = self.route_cache[key]
+        else:
+            best_path = self.search_best_route()
+            self.route_cache[key] = best_path
+
+        #if suggested path and the new path are not equal
+        if best_path and best_path != [self.state.current_node] + self.state.remaining_path:
+            self.route = best_path[1:]
+            self.path = best_path
+            self.state = GameState(self.state.vehicle, best_path[0], best_path[1:], self.state.disruptions[:], self.state.cost, False)
+
+    def search_best_route(self):
+        # Get all paths from current node to destination
+        all_paths = list(nx.all_simple_paths(nx.DiGraph(map_graph), self.state.current_node, self.path[-1]))
+        best_score = float('-inf')
+        best_path = None
+
+        for p in all_paths:
+            if len(p) < 2: continue
+            vehicle_copy = Vehicle(self.vehicle.item, self.vehicle.quantity, self.state.vehicle.shelf_life)
+            candidate_state = GameState(vehicle_copy, p[0], p[1:], self.state.disruptions[:], self.state.cost, False)
+            score, _ = minimax(candidate_state, 2, True)
+            if score > best_score:
+                best_score = score
+                best_path = p
+        return best_path
+
+    def eta(self):
+        # sum of weights of remaining path from current_node
+        eta = 0
+        current = self.state.current_node
+        for next_node in self.state.remaining_path:
+            eta += map_graph[current][next_node]
+            current = next_node
+        return eta
+
+    def close(self):
+        if self.recorder:
+            self.recorder.close()
+
+# Streaming disruptions for many vehicles on the shared map
+def edge_key(node1, node2):
+    # delays hit both directions of an edge
+    return (node1, node2) if node1 <= node2 else (node2, node1)
+
+
+def read_disruption_event(event):
+    """(node1, node2, type, delay) for a feed event; ValueError if it can't be applied."""
+    try:
+        node1, node2 = event["edge"]
+        disruption_type = event.get("type", "Traffic")
+        if "delay" in event:
+            delay = event["delay"]
+        else:
+            delay = disruption_delay(disruption_type, event.get("level", "Medium"))
+        known_edge = node1 in map_graph and node2 in map_graph[node1]
+    except (KeyError, TypeError, ValueError, AttributeError) as exc:
+        raise ValueError(f"malformed event {event!r}") from exc
+    if not known_edge:
+        raise ValueError(f"unknown edge {node1}-{node2}")
+    if isinstance(delay, bool) or not isinstance(delay, (int, float)):
+        raise ValueError(f"delay must be a number, got {delay!r}")
+    if not (math.isfinite(delay) and 0 <= delay <= MAX_FEED_DELAY):
+        raise ValueError(f"delay must be between 0 and {MAX_FEED_DELAY}, got {delay!r}")
+    return node1, node2, disruption_type, delay
+
+
+class Fleet:
+    """Vehicles in flight on the shared map_graph, indexed by the edges still ahead of them."""
+
+    def __init__(self):
+        self.vehicles = {}
+        self.edge_index = {}
+        self.vehicle_edges = {}
+
+    def add(self, vehicle_id, src, dst, item, shelf_life=None):
+        session = LogisticsSession()
+        path = session.start(src, dst, item, shelf_life=shelf_life)
+        if path:
+            self.vehicles[vehicle_id] = session
+            self.index(vehicle_id)
+        return path
+
+    def index(self, vehicle_id):
+        self.unindex(vehicle_id)
+        state = self.vehicles[vehicle_id].state
+        if state.is_terminal():
+            return
+        route = [state.current_node] + state.remaining_path
+        edges = {edge_key(a, b) for a, b in zip(route, route[1:])}
+        self.vehicle_edges[vehicle_id] = edges
+        for edge in edges:
+            self.edge_index.setdefault(edge, set()).add(vehicle_id)
+
+    def unindex(self, vehicle_id):
+        for edge in self.vehicle_edges.pop(vehicle_id, ()):
+            vehicles = self.edge_index[edge]
+            vehicles.discard(vehicle_id)
+            if not vehicles:
+                del self.edge_index[edge]
+
+    def next_move(self, vehicle_id):
+        state = self.vehicles[vehicle_id].next_move()
+        self.index(vehicle_id)
+        return state
+
+    def apply_batch(self, events):
+        """Apply a batch of disruption events to map_graph, then replan each affected vehicle once."""
+        affected = {}
+        for event in events:
+            try:
+                node1, node2, disruption_type, delay = read_disruption_event(event)
+            except ValueError:
+                continue
+            apply_edge_delay(node1, node2, delay)
+            label = disruption_label(node1, node2, disruption_type, delay)
+            for vehicle_id in self.edge_index.get(edge_key(node1, node2), ()):
+                affected.setdefault(vehicle_id, []).append((node1, node2, delay, label))
+
+        for vehicle_id, disruptions in affected.items():
+            self.vehicles[vehicle_id].reroute(disruptions)
+            self.index(vehicle_id)
+        return list(affected)
+
+
+async def read_event_lines(source):
+    """Yield lines from a file, a named pipe, stdin ("-") or a host:port socket."""
+    loop = asyncio.get_running_loop()
+    if source == "-" or (os.path.exists(source) and stat.S_ISFIFO(os.stat(source).st_mode)):
+        reader = asyncio.StreamReader()
+        pipe = sys.stdin.buffer if source == "-" else open(source, "rb")
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    elif os.path.exists(source):
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                yield line
+                await asyncio.sleep(0)
+        return
+    elif ":" in source:
+        host, port = source.rsplit(":", 1)
+        reader, _ = await asyncio.open_connection(host, int(port))
+    else:
+        raise FileNotFoundError(f"No such event source: {source}")
+
+    async for line in reader:
+        yield line.decode("utf-8")
+
+
+async def stream_disruptions(fleet, source, batch_size=32, batch_window=0.05, max_pending=256):
+    """Feed disruption events from source into the fleet in micro-batches.
+
+    Events are JSON lines such as {"edge": ["Delhi", "Jaipur"], "type": "Traffic", "level": "Hard"}.
+    The queue is bounded, so when replanning falls behind the reader stops pulling from the source.
+    """
+    queue = asyncio.Queue(maxsize=max_pending)
+    stats = {"events": 0, "batches": 0, "rerouted": 0, "skipped": 0}
+
+    async def produce():
+        try:
+            async for line in read_event_lines(source):
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                    read_disruption_event(event)
+                except ValueError as exc:
+                    stats["skipped"] += 1
+                    print(f"Skipping disruption event: {exc}", file=sys.stderr)
+                    continue
+                await queue.put(event)
+        finally:
+            # always wake the consumer; a source error is re-raised when the producer is awaited
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    loop = asyncio.get_running_loop()
+    done = False
+    try:
+        while not done:
+            event = await queue.get()
+            if event is None:
+                break
+            batch = [event]
+            deadline = loop.time() + batch_window
+            while len(batch) < batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    done = True
+                    break
+                batch.append(event)
+
+            rerouted = fleet.apply_batch(batch)
+            stats["events"] += len(batch)
+            stats["batches"] += 1
+            stats["rerouted"] += len(rerouted)
+        await producer
+    finally:
+        producer.cancel()
+    return stats
+
+
+# Region-partitioned routing: one worker process per region shard
+def partition_regions(coords, region_count):
+    """Split {name: (lat, lon)} into region_count regions of similar size by repeated median cuts."""
+    regions = [list(coords)]
+    while len(regions) < min(region_count, len(coords)):
+        regions.sort(key=len)
+        names = regions.pop()
+        lats = [coords[name][0] for name in names]
+        lons = [coords[name][1] for name in names]
+        axis = 0 if max(lats) - min(lats) >= max(lons) - min(lons) else 1
+        names.sort(key=lambda name: coords[name][axis])
+        mid = len(names) // 2
+        regions += [names[:mid], names[mid:]]
+    return {name: region for region, names in enumerate(regions) for name in names}
+
+
+class RegionRouter:
+    """Routes over a graph split into regions, each shard served by its own worker process.
+
+    Workers precompute boundary-to-boundary tables for their region. The router keeps only the
+    overlay of boundary nodes, so a query is two local searches (run in parallel in the source
+    and destination workers) plus a search over the overlay. Tables are built from the graph at
+    start-up; start a new router after disruptions change the weights.
+    """
+
+    def __init__(self, region_count=4, graph=None, coords=city_coords):
+        graph = map_graph if graph is None else graph
+        self.region_of = partition_regions(coords, region_count)
+        self.index = SpatialIndex(coords, graph)
+
+        shards = {}
+        boundary = {}
+        cross_edges = []
+        for node, edges in graph.items():
+            region = self.region_of[node]
+            shard = shards.setdefault(region, {}).setdefault(node, {})
+            for neighbor, weight in edges.items():
+                if self.region_of[neighbor] == region:
+                    shard[neighbor] = weight
+                else:
+                    boundary.setdefault(region, set()).add(node)
+                    boundary.setdefault(self.region_of[neighbor], set()).add(neighbor)
+                    cross_edges.append((node, neighbor, weight))
+
+        # workers run region_worker.py as a script rather than through multiprocessing, which would
+        # re-import main.py (and networkx, matplotlib, tkinter) into every one of them
+        self.workers = {}
+        for region, shard in shards.items():
+            process = subprocess.Popen([sys.executable, region_worker.__file__],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            conn = WorkerConnection(process.stdout, process.stdin)
+            conn.send((shard, sorted(boundary.get(region, ()))))
+            self.workers[region] = (process, conn)
+
+        self.overlay = {}
+        for region, (_, conn) in self.workers.items():
+            for node, found in conn.recv().items():
+                self.overlay.setdefault(node, {}).update(found)
+        for node, neighbor, weight in cross_edges:
+            self.overlay.setdefault(node, {})[neighbor] = (weight, [node, neighbor])
+
+    def route(self, src, dst):
+        return self.route_many([(src, dst)])[0]
+
+    def route_many(self, pairs, window=16):
+        """Quickest path for each (src, dst) pair; local searches are pipelined across the workers."""
+        # check every name before sending anything, so a bad pair can't leave replies unread in the pipes
+        for src, dst in pairs:
+            for name in (src, dst):
+                if self.region_of.get(name) not in self.workers:
+                    raise ValueError(f"Unknown city: {name}")
+        routes = []
+        for start in range(0, len(pairs), window):
+            chunk = pairs[start:start + window]
+            for src, dst in chunk:
+                self.workers[self.region_of[src]][1].send(("from", src, dst))
+                self.workers[self.region_of[dst]][1].send(("to", dst))
+            for src, dst in chunk:
+                leaving = self.workers[self.region_of[src]][1].recv()
+                arriving = self.workers[self.region_of[dst]][1].recv()
+                routes.append(self.overlay_search(src, dst, leaving, arriving))
+        return routes
+
+    def overlay_search(self, src, dst, leaving, arriving):
+        if src == dst:
+            return [src]
+        # A* over the overlay: every overlay hop is a real path, so the straight-line bound still holds
+        heap = [(self.index.time_bound(src, dst), 0, src)]
+        dist = {src: 0}
+        via = {src: None}
+        while heap:
+            _, time_, node = heapq.heappop(heap)
+            if node == dst:
+                break
+            if time_ > dist[node]:
+                continue
+            hops = list(self.overlay.get(node, {}).items())
+            if node == src:
+                hops += leaving.items()
+            if node in arriving:
+                hops.append((dst, arriving[node]))
+            for neighbor, (weight, segment) in hops:
+                arrival = time_ + weight
+                if arrival < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = arrival
+                    via[neighbor] = (node, segment)
+                    heapq.heappush(heap, (arrival + self.index.time_bound(neighbor, dst), arrival, neighbor))
+
+        if dst not in via:
+            return []
+        segments = []
+        node = dst
+        while via[node] is not None:
+            node, segment = via[node]
+            segments.append(segment)
+        path = [src]
+        for segment in reversed(segments):
+            path += segment[1:]
+        return path
+
+    def close(self):
+        for process, conn in self.workers.values():
+            conn.send(("stop",))
+            process.wait()
+            conn.close()
+        self.workers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 # GUI
 class LogisticsGameGUI:
     def __init__(self, root):
@@ -172,6 +943,15 @@ class LogisticsGameGUI:
         self.disrupt_btn = tk.Button(root, text="Introduce Disruption", command=self.introduce_disruption, state='disabled', **btn_style)
         self.disrupt_btn.pack(pady=5)
 
+        self.history_frame = tk.Frame(root, bg="#f0f4f8")
+        self.history_frame.pack(pady=5)
+
+        self.undo_btn = tk.Button(self.history_frame, text="Undo Disruption", command=self.undo_disruption, state='disabled', **btn_style)
+        self.undo_btn.grid(row=0, column=0, padx=5)
+
+        self.redo_btn = tk.Button(self.history_frame, text="Redo Disruption", command=self.redo_disruption, state='disabled', **btn_style)
+        self.redo_btn.grid(row=0, column=1, padx=5)
+
         self.next_btn = tk.Button(root, text="Next Move", command=self.next_move, state='disabled', **btn_style)
         self.next_btn.pack(pady=5)
 
@@ -181,6 +961,8 @@ class LogisticsGameGUI:
         self.info_label = tk.Label(self.root, text="", font=("Helvetica", 12), bg="#f0f4f8", justify="left")
         self.info_label.pack(pady=10)
 
+        self.disrupted_edges = set()
+        self.city_index = SpatialIndex(city_coords)
         self.reset()
 
     @staticmethod
@@ -198,15 +980,27 @@ class LogisticsGameGUI:
         return norm_coords
 
 
+    def route_viewport(self):
+        lats = [city_coords[city][0] for city in self.session.path]
+        lons = [city_coords[city][1] for city in self.session.path]
+        return (min(lats) - MAP_VIEWPORT_MARGIN, min(lons) - MAP_VIEWPORT_MARGIN,
+                max(lats) + MAP_VIEWPORT_MARGIN, max(lons) + MAP_VIEWPORT_MARGIN)
+
     def show_map(self):
         G = nx.DiGraph()
-        disrupted = getattr(self, 'disrupted_edges', set())
+        disrupted = self.disrupted_edges | self.session.disrupted_edges
 
-        for node in map_graph:
+        visible = set(map_graph)
+        if len(city_coords) > MAP_MAX_CITIES and len(self.session.path) > 1:
+            visible = set(self.city_index.within(*self.route_viewport())) | set(self.session.path)
+
+        G.add_nodes_from(visible)
+        for node in visible:
             for neighbor, weight in map_graph[node].items():
-                G.add_edge(node, neighbor, weight=weight)
+                if neighbor in visible:
+                    G.add_edge(node, neighbor, weight=weight)
 
-        pos = self.normalize_coords(city_coords)
+        pos = self.normalize_coords({city: city_coords[city] for city in G.nodes})
         edge_labels = nx.get_edge_attributes(G, 'weight')
 
         plt.figure(figsize=(10, 7))
@@ -222,9 +1016,9 @@ class LogisticsGameGUI:
 
         nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
 
-        if self.vehicle:
-            src = self.path[0]
-            dst = self.path[-1]
+        if self.session.vehicle:
+            src = self.session.path[0]
+            dst = self.session.path[-1]
             nx.draw_networkx_nodes(G, pos, nodelist=[src], node_color='green')
             nx.draw_networkx_nodes(G, pos, nodelist=[dst], node_color='red')
 
@@ -233,81 +1027,66 @@ class LogisticsGameGUI:
 
 
     def reset(self):
-        self.vehicle = None
-        self.state = None
-        self.path = []
-        self.route = []
-
-    def find_path(self, src, dst):
-        from collections import deque
-        queue = deque([(src, [src])])
-        visited = set()
-        while queue:
-            node, path = queue.popleft()
-            if node == dst:
-                return path
-            for neighbor in map_graph.get(node, {}):
-                if neighbor not in visited:
-                    visited.add(neighbor)
-                    queue.append((neighbor, path + [neighbor]))
-        return []
+        if getattr(self, 'session', None):
+            # disruptions of a finished game stay on the map
+            self.disrupted_edges.update(self.session.disrupted_edges)
+            self.session.close()
+        self.session = LogisticsSession()
+
+    def resolve_location(self, text):
+        # a "lat, lon" GPS point snaps to the nearest city
+        try:
+            lat, lon = (float(part) for part in text.split(","))
+        except ValueError:
+            return text.strip().title()
+        return self.city_index.nearest(lat, lon)[0][0]
 
     #method to satrt the game
     def start_game(self):
-        src = self.source_entry.get().strip().title()
-        dst = self.destination_entry.get().strip().title()
+        src = self.resolve_location(self.source_entry.get())
+        dst = self.resolve_location(self.destination_entry.get())
         item = self.selected_item.get()
-        shelf_life = ITEM_SHELF_LIFE[item]
 
         if src not in map_graph or dst not in map_graph:
             messagebox.showerror("Invalid Input", "Invalid Source or Destination")
             return
 
-        path = self.find_path(src, dst)
-        if not path or path[0] != src or path[-1] != dst:
+        self.reset()
+        self.session.recorder = SessionRecorder.new_session()
+        path = self.session.start(src, dst, item, self.difficulty.get())
+        if not path:
             messagebox.showerror("No Route", "No valid path found.")
             return
 
-        self.vehicle = Vehicle(item, quantity=None, shelf_life=shelf_life)
-        self.vehicle.position = src
-        self.path = path
-        self.route = path[1:]
-        self.state = GameState(self.vehicle, src, self.route, [], 0, False)
         self.update_info()
 
         self.disrupt_btn.config(state='normal')
         self.next_btn.config(state='normal')
+        self.undo_btn.config(state='normal')
+        self.redo_btn.config(state='normal')
 
     #Helper method for the introduced disruptions function
     def apply_disruption(self, popup, node1, node2, disruption_type):
         popup.destroy()
 
-        level = self.difficulty.get().lower()
-
-        if disruption_type.lower() == 'weather':
-            delay = {'easy': 10, 'medium': 15, 'hard': 20}[level]
-        else:
-            delay = {'easy': 20, 'medium': 30, 'hard': 40}[level]
-
-        map_graph[node1][node2] += delay
-        if node2 in map_graph and node1 in map_graph[node2]:
-            map_graph[node2][node1] += delay
-
-        label = f"{disruption_type.title()} delay of {delay} at edge {node1}-{node2}"
-        self.state.disruptions.append(label)
+        self.session.disrupt(node1, node2, disruption_type, self.difficulty.get())
+        self.update_info()
 
-        # Save for map highlight
-        if not hasattr(self, 'disrupted_edges'):
-            self.disrupted_edges = set()
-        self.disrupted_edges.add((node1, node2))
-        self.disrupted_edges.add((node2, node1))  # Assume bi-directional for highlight
+    def undo_disruption(self):
+        if self.session.undo() is None:
+            messagebox.showinfo("Undo", "No disruption to undo.")
+            return
+        self.update_info()
 
-        self.recalculate_best_route()
+    def redo_disruption(self):
+        if self.session.redo() is None:
+            messagebox.showinfo("Redo", "No disruption to redo.")
+            return
         self.update_info()
 
 
     def introduce_disruption(self):
-        if self.state.is_terminal():
+        if self.session.state.is_terminal():
             return
 
         edge_input = tk.simpledialog.askstring(
@@ -337,60 +1116,178 @@ class LogisticsGameGUI:
 
 
     def next_move(self):
-        if self.state.is_terminal():
-            result = "Delivered Successfully!" if self.state.delivered else "Goods Spoiled!"
+        if self.session.state.is_terminal():
+            result = "Delivered Successfully!" if self.session.state.delivered else "Goods Spoiled!"
             messagebox.showinfo("Game Over", result)
             return
 
-        _, new_state = minimax(self.state, 2, True)
-        self.state = new_state
+        self.session.next_move()
         self.update_info()
 
-    def recalculate_best_route(self):
-        # Get all paths from current node to destination
-        all_paths = list(nx.all_simple_paths(nx.DiGraph(map_graph), self.state.current_node, self.path[-1]))
-        best_score = float('-inf')
-        best_path = None
-
-        for p in all_paths:
-            if len(p) < 2: continue
-            vehicle_copy = Vehicle(self.vehicle.item, self.vehicle.quantity, self.state.vehicle.shelf_life)
-            candidate_state = GameState(vehicle_copy, p[0], p[1:], self.state.disruptions[:], self.state.cost, False)
-            score, _ = minimax(candidate_state, 2, True)
-            if score > best_score:
-                best_score = score
-                best_path = p
-
-        #if suggested path and the new path are not equal
-        if best_path and best_path != [self.state.current_node] + self.state.remaining_path:
-            self.route = best_path[1:]
-            self.path = best_path
-            self.state = GameState(self.vehicle, best_path[0], best_path[1:], self.state.disruptions[:], self.state.cost, False)
-
-
     def update_info(self):
-        truck_loc = self.state.current_node
-        route_str = " -> ".join([truck_loc] + self.state.remaining_path)
-        # Calculate ETA (sum of weights of remaining path from current_node)
-        eta = 0
-        current = truck_loc
-        for next_node in self.state.remaining_path:
-            eta += map_graph[current][next_node]
-            current = next_node
+        state = self.session.state
+        truck_loc = state.current_node
+        route_str = " -> ".join([truck_loc] + state.remaining_path)
 
         status = (
             f"Truck Currently at: {truck_loc}\n"
             f"Route Status: {route_str}\n"
-            f"ETA: {eta}\n"
-            f"Elapsed Time: {self.state.cost}\n"
-            f"Shelf Life Left: {self.state.vehicle.shelf_life}\n"
-            f"Disruptions: {self.state.disruptions}"
+            f"ETA: {self.session.eta()}\n"
+            f"Elapsed Time: {state.cost}\n"
+            f"Shelf Life Left: {state.vehicle.shelf_life}\n"
+            f"Disruptions: {state.disruptions}"
         )  
 
         self.info_label.config(text=status)
 
+
+# Headless replay of recorded sessions
+def copy_graph(graph):
+    return {node: dict(edges) for node, edges in graph.items()}
+
+def load_session_log(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def replay_session(path, compare_timing=False):
+    """Re-run a session log against the planner and report decisions that no longer match."""
+    events = load_session_log(path)
+    result = {"log": path, "events": len(events), "mismatches": [], "recorded_ms": 0.0, "replayed_ms": 0.0}
+    session = LogisticsSession()
+    saved_graph = copy_graph(map_graph)
+    elapsed = 0.0
+
+    try:
+        for index, event in enumerate(events):
+            kind = event["event"]
+            if kind == "start":
+                map_graph.clear()
+                map_graph.update(copy_graph(event["graph"]))
+                session.reset()
+                started = time.perf_counter()
+                session.start(event["src"], event["dst"], event["item"], event["difficulty"], event["shelf_life"])
+                elapsed = (time.perf_counter() - started) * 1000
+            elif kind == "disruption":
+                node1, node2 = event["edge"]
+                started = time.perf_counter()
+                session.disrupt(node1, node2, event["type"], event["level"])
+                elapsed = (time.perf_counter() - started) * 1000
+            elif kind in ("undo", "redo"):
+                started = time.perf_counter()
+                session.undo() if kind == "undo" else session.redo()
+                elapsed = (time.perf_counter() - started) * 1000
+            elif kind == "route":
+                actual = [session.state.current_node] + session.state.remaining_path if session.state else []
+                if actual != event["path"]:
+                    result["mismatches"].append((index, "route", event["path"], actual))
+                result["recorded_ms"] += event["elapsed_ms"]
+                result["replayed_ms"] += elapsed
+            elif kind == "move":
+                started = time.perf_counter()
+                state = session.next_move()
+                result["replayed_ms"] += (time.perf_counter() - started) * 1000
+                result["recorded_ms"] += event["elapsed_ms"]
+                expected = (event["node"], event["cost"], event["shelf_life"])
+                actual = (state.current_node, state.cost, state.vehicle.shelf_life)
+                if actual != expected:
+                    result["mismatches"].append((index, "move", expected, actual))
+    finally:
+        map_graph.clear()
+        map_graph.update(saved_graph)
+
+    if not compare_timing:
+        del result["recorded_ms"], result["replayed_ms"]
+    return result
+
+def replay_sessions(paths, compare_timing=False):
+    results = []
+    for path in paths:
+        # one unreadable, truncated or malformed log fails on its own instead of stopping the run
+        try:
+            result = replay_session(path, compare_timing)
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            print(f"{path}: FAILED ({type(exc).__name__}: {exc})")
+            results.append({"log": path, "error": str(exc), "mismatches": []})
+            continue
+        status = "OK" if not result["mismatches"] else f"{len(result['mismatches'])} MISMATCH(ES)"
+        line = f"{path}: {result['events']} events, {status}"
+        if compare_timing:
+            line += f", planner {result['recorded_ms']:.2f}ms recorded / {result['replayed_ms']:.2f}ms replayed"
+        print(line)
+        for index, kind, expected, actual in result["mismatches"]:
+            print(f"    event {index} ({kind}): recorded {expected}, replayed {actual}")
+        results.append(result)
+    return results
+
 # Main function
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Perishable Goods Logistics Optimizer")
+    parser.add_argument("--replay", nargs="+", metavar="LOG", help="replay session logs headless instead of opening the GUI")
+    parser.add_argument("--timing", action="store_true", help="compare recorded and replayed planner time")
+    parser.add_argument("--feed", metavar="SOURCE", help="apply disruption events from a file, pipe, '-' or host:port")
+    parser.add_argument("--vehicle", nargs=3, action="append", default=[], metavar=("SRC", "DST", "ITEM"),
+                        help="vehicle in flight for --feed (repeatable)")
+    parser.add_argument("--route", nargs=2, metavar=("SRC", "DST"), help="quickest route using region worker processes")
+    parser.add_argument("--regions", type=int, default=4, help="number of regions (and worker processes) for --route")
+    parser.add_argument("--plan", nargs=2, metavar=("SRC", "DST"), help="route every catalogue item from one shelf-life plan")
+    parser.add_argument("--check-plans", action="store_true", help="check plan lookups against the full route search")
+    args = parser.parse_args()
+
+    if args.route:
+        src, dst = (name.title() for name in args.route)
+        with RegionRouter(args.regions) as router:
+            if src not in router.region_of or dst not in router.region_of:
+                print("Invalid Source or Destination")
+                sys.exit(1)
+            path = router.route(src, dst)
+        print(" -> ".join(path) if path else "No valid path found.")
+        sys.exit(0 if path else 1)
+
+    if args.plan:
+        src, dst = (name.title() for name in args.plan)
+        if src not in map_graph or dst not in map_graph:
+            print("Invalid Source or Destination")
+            sys.exit(1)
+        for item, path in plan_catalogue(src, dst).items():
+            print(f"{item}: " + (" -> ".join(path) if path else "No valid path found."))
+        sys.exit(0)
+
+    if args.check_plans:
+        mismatches = check_plans()
+        for src, dst, shelf_life in mismatches:
+            print(f"{src} -> {dst} at shelf life {shelf_life}: plan differs from search_best_route")
+        print(f"{len(mismatches)} mismatches")
+        sys.exit(1 if mismatches else 0)
+
+    if args.feed:
+        fleet = Fleet()
+        for number, (src, dst, item) in enumerate(args.vehicle, 1):
+            src, dst, item = src.title(), dst.title(), item.title()
+            if src not in map_graph or dst not in map_graph:
+                print(f"Vehicle {number}: Invalid Source or Destination")
+                sys.exit(1)
+            if item not in ITEM_SHELF_LIFE:
+                print(f"Vehicle {number}: unknown item {item} (choose from {', '.join(ITEM_SHELF_LIFE)})")
+                sys.exit(1)
+            if not fleet.add(number, src, dst, item):
+                print(f"Vehicle {number}: No valid path found from {src} to {dst}")
+                sys.exit(1)
+        try:
+            stats = asyncio.run(stream_disruptions(fleet, args.feed))
+        except (OSError, ValueError) as exc:
+            print(f"Cannot read disruption feed: {exc}", file=sys.stderr)
+            sys.exit(1)
+        print(f"{stats['events']} events in {stats['batches']} batches, {stats['rerouted']} reroutes, "
+              f"{stats['skipped']} skipped")
+        for number, session in fleet.vehicles.items():
+            print(f"Vehicle {number}: " + " -> ".join([session.state.current_node] + session.state.remaining_path))
+        sys.exit(0)
+
+    if args.replay:
+        results = replay_sessions(args.replay, args.timing)
+        sys.exit(1 if any(r["mismatches"] or "error" in r for r in results) else 0)
+
     root = tk.Tk()
     app = LogisticsGameGUI(root)
     root.mainloop()
\ No newline at end of file
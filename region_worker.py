@@ -0,0 +1,86 @@
+"""Region shard worker for RegionRouter.
+
+RegionRouter runs this file as a script, one process per region, talking to it over stdin and
+stdout. It is kept apart from main.py and limited to the standard library so a worker starts
+without the GUI and plotting libraries.
+"""
+import heapq
+import pickle
+import sys
+
+
+class WorkerConnection:
+    """send/recv of pickled messages over a pair of binary streams (a worker's stdin and stdout)."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, message):
+        pickle.dump(message, self.writer)
+        self.writer.flush()
+
+    def recv(self):
+        return pickle.load(self.reader)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+def shortest_paths(graph, src, targets):
+    """Dijkstra from src, returning {target: (time, path)} for the reachable targets."""
+    dist = {src: 0}
+    parent = {src: None}
+    heap = [(0, src)]
+    remaining = set(targets)
+    while heap and remaining:
+        time_, node = heapq.heappop(heap)
+        if time_ > dist[node]:
+            continue
+        remaining.discard(node)
+        for neighbor, weight in graph.get(node, {}).items():
+            if time_ + weight < dist.get(neighbor, float('inf')):
+                dist[neighbor] = time_ + weight
+                parent[neighbor] = node
+                heapq.heappush(heap, (time_ + weight, neighbor))
+
+    found = {}
+    for target in targets:
+        if target in dist:
+            path = [target]
+            while parent[path[-1]] is not None:
+                path.append(parent[path[-1]])
+            found[target] = (dist[target], path[::-1])
+    return found
+
+def serve_region(conn, shard, boundary):
+    """Worker loop: holds one region's edges and answers local searches over them."""
+    reverse = {}
+    for node, edges in shard.items():
+        for neighbor, weight in edges.items():
+            reverse.setdefault(neighbor, {})[node] = weight
+
+    conn.send({node: shortest_paths(shard, node, boundary) for node in boundary})
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            # the router exited without sending stop
+            break
+        if request[0] == "from":
+            _, src, dst = request
+            conn.send(shortest_paths(shard, src, boundary + ([dst] if dst in shard else [])))
+        elif request[0] == "to":
+            _, dst = request
+            found = shortest_paths(reverse, dst, boundary)
+            conn.send({node: (time_, path[::-1]) for node, (time_, path) in found.items()})
+        else:
+            break
+    conn.close()
+
+
+if __name__ == "__main__":
+    conn = WorkerConnection(sys.stdin.buffer, sys.stdout.buffer)
+    shard, boundary = conn.recv()
+    serve_region(conn, shard, boundary)